@@ -1,15 +1,21 @@
 # main.py
 
+import os
 import sys
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from utils.node_finder import get_working_public_nodes
 from utils.block_watcher import watch_new_contracts
-from utils.source_checker import is_code_verified
+from utils.source_checker import get_source_hashes, ETHERSCAN_BATCH_SIZE
 
 # Import the two Slither‐related helpers:
-#   run_slither(...) → runs Slither and dumps JSON
+#   analyze(...) → runs Slither in-process (in a pool worker) and dumps JSON
 #   find_true_arbitrary_send_vulns(...) → returns only unguarded arbitrary-send-eth functions
-from utils.slither_analyzer import run_slither, find_true_arbitrary_send_vulns
+from utils.slither_worker import analyze
+from utils.slither_analyzer import find_true_arbitrary_send_vulns
 
 # ANSI color codes
 GREEN  = "\033[92m"
@@ -18,48 +24,156 @@ CYAN   = "\033[96m"
 RED    = "\033[91m"
 RESET  = "\033[0m"
 
-def main():
-    try:
-        print(f"{CYAN}🔍 Finding node endpoints to use...{RESET}")
-        rpc_endpoints = get_working_public_nodes(burst=50, top_n=5, timeout=1)
-        if not rpc_endpoints:
-            print(f"{YELLOW}⚠️  No reliable RPC endpoints available.{RESET}")
-            return
-
-        print(f"{GREEN}✅ Found {len(rpc_endpoints)} HTTPS node endpoints to use{RESET}\n")
-        print(f"{CYAN}⏳ Listening for new contracts… (Ctrl+C to exit){RESET}\n")
-
-        for addr, balance in watch_new_contracts(rpc_endpoints):
-            timestamp = datetime.utcnow().strftime("%H:%M:%S UTC")
-
-            # 1) Only proceed if the contract's source is verified on Etherscan
-            if not is_code_verified(addr, 1):  # 1 = mainnet
-                print(f"{RESET}[{timestamp}] UNVERIFIED {addr} | {balance/1e18:,.2f} ETH{RESET}")
-                continue
-
-            print(f"{GREEN}[{timestamp}] ✔ VERIFIED {addr} | {balance/1e18:,.2f} ETH{RESET}")
-
-            # 2) Run Slither on this address (produces slither-reports/<addr>.json)
-            print(f"{CYAN}   🔎 Running Slither on mainnet:{addr}{RESET}")
-            succeeded = run_slither("mainnet", addr)
-            if not succeeded:
-                print(f"{RED}   ❌ Slither failed for {addr}{RESET}")
-                continue
-
-            # 3) Now fetch only the “true” arbitrary-send-eth drains:
-            vulns = find_true_arbitrary_send_vulns(addr)
-            if not vulns:
-                # None survived our “public & unguarded” filters → no real drain
-                print(f"{GREEN}   ✅ No unguarded ETH-drain functions found{RESET}\n")
-                continue
-
-            # 4) Print a PROFIT ALERT for each drainable function
+# No colors when stdout is piped or redirected (e.g. into a log file)
+if not sys.stdout.isatty():
+    GREEN = YELLOW = CYAN = RED = RESET = ""
+
+# Per-contract message templates, built once instead of an f-string per line
+UNVERIFIED_FMT   = f"{RESET}[{{}}] UNVERIFIED {{}} | {{:,.2f}} ETH{RESET}"
+VERIFIED_FMT     = f"{GREEN}[{{}}] ✔ VERIFIED {{}} | {{:,.2f}} ETH{RESET}"
+RUNNING_FMT      = f"{CYAN}   🔎 Running Slither on mainnet:{{}}{RESET}"
+SLITHER_FAIL_FMT = f"{RED}   ❌ Slither failed for {{}}{RESET}"
+NO_DRAIN_FMT     = f"{GREEN}   ✅ No unguarded ETH-drain functions found for {{}}{RESET}\n"
+ALERT_FMT        = f"{RED}💥 PROFIT ALERT: {{}} is drainable via {{}}(){RESET}"
+
+# Contracts a Slither worker analyzes before it is replaced, so memory that slither/solc
+# leave behind can't pile up forever in a long-lived worker
+SLITHER_TASKS_PER_CHILD = 50
+
+# Verify workers (concurrent Etherscan lookups); the free tier's 5 calls/sec limit itself
+# is enforced in utils.source_checker, shared by all of them
+ETHERSCAN_CONCURRENCY = 5
+
+
+class SlitherPool:
+    """
+    The ProcessPoolExecutor behind the Slither stage, rebuilt if a worker dies. A dead
+    worker (e.g. OOM-killed mid-analysis) breaks a ProcessPoolExecutor for good, which
+    would otherwise fail every later contract.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = self._new_pool()
+
+    def _new_pool(self):
+        if sys.version_info >= (3, 11):
+            return ProcessPoolExecutor(max_workers=self.workers,
+                                       max_tasks_per_child=SLITHER_TASKS_PER_CHILD)
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+    async def run(self, fn, *args):
+        pool = self.pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # Every in-flight task sees the same broken pool; only the first replaces it
+            if self.pool is pool:
+                self.pool = self._new_pool()
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def watch_stage(rpc_endpoints, verify_queue):
+    """Stage 1: feed every newly-detected (timestamp, addr, balance) to the verifiers."""
+    async for addr, balance in watch_new_contracts(rpc_endpoints):
+        timestamp = datetime.utcnow().strftime("%H:%M:%S UTC")
+        await verify_queue.put((timestamp, addr, balance))
+
+
+async def verify_stage(verify_queue, slither_queue):
+    """Stage 2: only pass on contracts whose source is verified on Etherscan."""
+    while True:
+        # Take whatever is queued (up to one Etherscan batch) so it costs a single request
+        batch = [await verify_queue.get()]
+        while len(batch) < ETHERSCAN_BATCH_SIZE and not verify_queue.empty():
+            batch.append(verify_queue.get_nowait())
+
+        # Blocking HTTP call runs in a thread so the watcher's event loop stays responsive
+        addrs = [addr for _, addr, _ in batch]
+        source_hashes = await asyncio.to_thread(get_source_hashes, addrs, 1)  # 1 = mainnet
+
+        for timestamp, addr, balance in batch:
+            source_hash = source_hashes.get(addr)
+            if source_hash is None:
+                print(UNVERIFIED_FMT.format(timestamp, addr, balance / 1e18))
+            else:
+                print(VERIFIED_FMT.format(timestamp, addr, balance / 1e18))
+                await slither_queue.put((addr, source_hash))
+
+            verify_queue.task_done()
+
+
+async def slither_stage(slither_queue, slither_pool):
+    """Stage 3: run Slither on a pool worker, then filter down to the true drains."""
+    while True:
+        addr, source_hash = await slither_queue.get()
+
+        # Run Slither on this address (produces slither-reports/<addr>.json,
+        # or reuses it if this exact verified source was analyzed before)
+        print(RUNNING_FMT.format(addr))
+        try:
+            succeeded = await slither_pool.run(analyze, "mainnet", addr, source_hash)
+        except Exception:
+            # A crashed worker only fails this contract, like a crashed `slither` subprocess
+            succeeded = False
+        if not succeeded:
+            print(SLITHER_FAIL_FMT.format(addr))
+            slither_queue.task_done()
+            continue
+
+        # Now fetch only the “true” arbitrary-send-eth drains:
+        vulns = await asyncio.to_thread(find_true_arbitrary_send_vulns, addr)
+        if not vulns:
+            # None survived our “public & unguarded” filters → no real drain
+            print(NO_DRAIN_FMT.format(addr))
+        else:
+            # Print a PROFIT ALERT for each drainable function
             for fn in vulns:
-                print(f"{RED}💥 PROFIT ALERT: {addr} is drainable via {fn}(){RESET}")
+                print(ALERT_FMT.format(addr, fn))
 
             # blank line before next contract
             print()
 
+        slither_queue.task_done()
+
+
+async def main_async():
+    print(f"{CYAN}🔍 Finding node endpoints to use...{RESET}")
+    rpc_endpoints = get_working_public_nodes(burst=50, top_n=5, timeout=1)
+    if not rpc_endpoints:
+        print(f"{YELLOW}⚠️  No reliable RPC endpoints available.{RESET}")
+        return
+
+    print(f"{GREEN}✅ Found {len(rpc_endpoints)} HTTPS node endpoints to use{RESET}\n")
+    print(f"{CYAN}⏳ Listening for new contracts… (Ctrl+C to exit){RESET}\n")
+
+    # Pipeline: watcher → verify workers → Slither workers, so block detection, Etherscan
+    # lookups and Slither runs for different contracts all overlap.
+    verify_queue = asyncio.Queue()
+    slither_queue = asyncio.Queue()
+
+    # Long-lived Slither workers: each keeps slither/crytic-compile imported across contracts
+    workers = os.cpu_count() or 1
+    slither_pool = SlitherPool(workers)
+    try:
+        await asyncio.gather(
+            watch_stage(rpc_endpoints, verify_queue),
+            *[verify_stage(verify_queue, slither_queue) for _ in range(ETHERSCAN_CONCURRENCY)],
+            *[slither_stage(slither_queue, slither_pool) for _ in range(workers)],
+        )
+    finally:
+        slither_pool.shutdown()
+
+
+def main():
+    # Library chatter (per-contract Slither/Etherscan progress) stays quiet unless it's a problem
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(main_async())
     except KeyboardInterrupt:
         print(f"\n{YELLOW}✋ Stopping watcher. Goodbye!{RESET}")
         sys.exit(0)
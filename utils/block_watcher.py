@@ -1,184 +1,383 @@
 # utils/block_watcher.py
 
+import asyncio
 import itertools
-import time
-from threading import Lock
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from web3 import Web3, HTTPProvider
+import json
+import httpx
+from web3 import Web3
 
-def _make_round_robin_w3_list(rpc_entries, timeout=10):
+# Max calls per JSON-RPC batch; many public nodes reject larger arrays
+_BATCH_SIZE = 50
+
+# Default cap on JSON-RPC requests in flight at once, across all endpoints
+# (matches the burst every endpoint survived in node_finder)
+_MAX_IN_FLIGHT = 50
+
+# Only contracts holding more than 0.1 ETH are reported
+_MIN_WEI = 100_000_000_000_000_000
+
+# Failed eth_getFilterChanges polls (e.g. load-balanced nodes forgetting filters)
+# tolerated before falling back to polling eth_blockNumber
+_MAX_FILTER_FAILURES = 3
+
+def _entry_url(entry):
+    """
+    Returns the URL of an rpc entry, which is either a "https://..." string
+    or a ("Name", "https://...") tuple.
+    """
+    if isinstance(entry, tuple) and len(entry) == 2:
+        return entry[1]
+    return entry
+
+
+def _make_endpoints(rpc_entries, timeout=10):
     """
     Accepts a list of either:
       - "https://..." strings
       - or ("Name", "https://...") tuples
 
-    Returns a cycle() iterator of Web3 instances, one per URL.
+    Returns a list of (url, httpx.AsyncClient) pairs, one HTTP/2 keep-alive client per URL.
     """
-    w3_list = []
+    endpoints = []
     for entry in rpc_entries:
-        # If it’s a tuple (name, url), grab the url
-        if isinstance(entry, tuple) and len(entry) == 2:
-            url = entry[1]
-        else:
-            url = entry
+        url = _entry_url(entry)
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=timeout,
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+        endpoints.append((url, client))
+    return endpoints
 
-        # Create a Web3 over HTTPProvider(url)
-        w3 = Web3(HTTPProvider(url, request_kwargs={"timeout": timeout}))
-        w3_list.append(w3)
 
-    return itertools.cycle(w3_list)
+class _MethodNotFound(Exception):
+    """Raised when an endpoint answers a call with JSON-RPC error -32601."""
 
 
-def watch_new_contracts(rpc_entries, from_block=None, poll_interval=2, max_workers=None):
+async def _rpc_call(endpoint, method, params):
     """
-    Generator that yields (contract_address, balance_wei) for any newly‐seen contract
-    whose balance > 0.1 ETH.
+    POSTs a single JSON-RPC call to `endpoint` and returns its result.
+    Raises _MethodNotFound if the endpoint doesn't implement `method`,
+    RuntimeError on any other JSON-RPC error, and on HTTP/transport errors.
+    """
+    url, client = endpoint
+    payload = {"jsonrpc": "2.0", "id": 1, "method": method, "params": params}
+    resp = await client.post(url, json=payload)
+    resp.raise_for_status()
 
-    Parameters:
-      rpc_entries   – list of either URL‐strings or (name, url) tuples
-      from_block    – if None, starts from latest block at call time; else start from that block number
-      poll_interval – seconds to wait between polling for new blocks (uses HTTP calls)
-      max_workers   – number of threads for per‐block parallel work. Defaults to len(rpc_entries)*2.
+    body = resp.json()
+    error = body.get("error")
+    if error:
+        if error.get("code") == -32601:
+            raise _MethodNotFound(f"{url} does not support {method}")
+        raise RuntimeError(f"{method} failed on {url}: {error}")
+    return body.get("result")
 
-    Internally:
-      • Rotates through all provided RPC URLs in round‐robin fashion, to spread the JSON‐RPC load.
-      • Uses get_block(..., full_transactions=False) to only fetch tx‐hashes.
-      • Spawns a small ThreadPoolExecutor to get_receipt/additional calls in parallel.
-      • Keeps a seen_contracts set (thread‐safe) so each contract is reported only once ever.
+
+async def _rpc_batch(endpoint, calls):
     """
-    if not rpc_entries:
-        raise ValueError("`rpc_entries` must be a non‐empty list of URLs or (name,url) tuples.")
+    POSTs `calls` – a list of (method, params) pairs – to `endpoint` as one JSON-RPC batch.
+
+    Returns a list of results in the same order as `calls`; entries that came back
+    with a JSON-RPC error are None. Raises on HTTP/transport errors.
+    """
+    url, client = endpoint
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    resp = await client.post(url, json=payload)
+    resp.raise_for_status()
+
+    body = resp.json()
+    if not isinstance(body, list):
+        # Some nodes answer a whole batch with a single error object
+        raise RuntimeError(f"Batch request rejected by {url}: {body}")
+
+    results = [None] * len(calls)
+    for item in body:
+        idx = item.get("id")
+        if isinstance(idx, int) and 0 <= idx < len(calls) and "error" not in item:
+            results[idx] = item.get("result")
+    return results
+
+
+async def _rpc_batch_chunked(rr_endpoints, sem, calls):
+    """
+    Runs `calls` as JSON-RPC batches of at most _BATCH_SIZE, each chunk on the next
+    round‐robin endpoint, all chunks concurrently (bounded by `sem`).
 
-    # Build a round‐robin iterator of Web3 instances
-    rr_w3 = _make_round_robin_w3_list(rpc_entries)
+    Returns results in the same order as `calls`; every call of a chunk whose POST
+    failed comes back as None.
+    """
+    chunks = [calls[i:i + _BATCH_SIZE] for i in range(0, len(calls), _BATCH_SIZE)]
+
+    async def _run(endpoint, chunk):
+        async with sem:
+            try:
+                return await _rpc_batch(endpoint, chunk)
+            except Exception:
+                return [None] * len(chunk)
 
-    # Default worker count: 2 threads per RPC endpoint
-    if max_workers is None:
-        max_workers = len(rpc_entries) * 2
+    batches = await asyncio.gather(*[_run(next(rr_endpoints), chunk) for chunk in chunks])
+    return [result for batch in batches for result in batch]
 
-    seen_contracts = set()
 
-    # Determine starting block number
-    w3_first = next(rr_w3)
-    try:
-        latest = w3_first.eth.block_number
-    except Exception as e:
-        raise RuntimeError(f"Unable to fetch latest block from any RPC: {e}")
+async def _ws_heads(url, poll_interval):
+    """
+    Async generator of chain‐head block numbers pushed by eth_subscribe("newHeads") over a
+    websocket, reconnecting after `poll_interval` seconds whenever the connection drops.
+    Needs the `websockets` package, which is only imported when a wss:// endpoint is used.
+    """
+    import websockets
+
+    subscribe = {"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}
+    while True:
+        try:
+            async with websockets.connect(url) as ws:
+                await ws.send(json.dumps(subscribe))
+                ack = json.loads(await ws.recv())
+                if "error" in ack:
+                    raise RuntimeError(f"newHeads subscription rejected by {url}: {ack['error']}")
+
+                async for message in ws:
+                    head = json.loads(message).get("params", {}).get("result") or {}
+                    if "number" in head:
+                        yield int(head["number"], 16)
+        except Exception:
+            await asyncio.sleep(poll_interval)
+
+
+async def _http_heads(rr_endpoints, poll_interval):
+    """
+    Async generator of chain‐head block numbers over plain HTTP.
+
+    Installs an eth_newBlockFilter on one endpoint (filters live on the node that created
+    them) and polls eth_getFilterChanges every `poll_interval` seconds, so the head is only
+    looked up when a block actually arrived. A filter that stops working is re‐installed on
+    the next endpoint; after _MAX_FILTER_FAILURES in a row, or if filters aren’t supported
+    at all, it falls back to polling eth_blockNumber.
+    """
+    endpoint = next(rr_endpoints)
+    filter_id = None
+    failures = 0
+    while failures < _MAX_FILTER_FAILURES:
+        try:
+            if filter_id is None:
+                filter_id = await _rpc_call(endpoint, "eth_newBlockFilter", [])
+
+            hashes = await _rpc_call(endpoint, "eth_getFilterChanges", [filter_id])
+            failures = 0
+            if hashes:
+                block = await _rpc_call(endpoint, "eth_getBlockByHash", [hashes[-1], False])
+                if block:
+                    yield int(block["number"], 16)
+        except _MethodNotFound:
+            break
+        except Exception:
+            failures += 1
+            endpoint = next(rr_endpoints)
+            filter_id = None
 
-    current = from_block if (from_block is not None) else latest
+        await asyncio.sleep(poll_interval)
 
-    # Main polling loop
+    # No usable filters: poll eth_blockNumber, rotating endpoints
+    last = None
     while True:
-        w3_poll = next(rr_w3)
         try:
-            latest = w3_poll.eth.block_number
+            latest = int(await _rpc_call(next(rr_endpoints), "eth_blockNumber", []), 16)
         except Exception:
             # If one endpoint fails, wait and try again
-            time.sleep(poll_interval)
-            continue
+            latest = None
 
-        if latest <= current:
-            # No new blocks yet
-            time.sleep(poll_interval)
+        if latest is not None and (last is None or latest > last):
+            last = latest
+            yield latest
             continue
 
-        # Process each new block in range(current+1 .. latest)
-        for block_number in range(current + 1, latest + 1):
-            w3_block = next(rr_w3)
-            try:
-                block = w3_block.eth.get_block(block_number, full_transactions=False)
-            except Exception:
-                # Skip this block if the call fails
-                continue
+        # No new blocks yet
+        await asyncio.sleep(poll_interval)
 
-            tx_hashes = block.transactions  # only a list of tx‐hashes
-            if not tx_hashes:
-                continue
 
-            # Parallelize per‐transaction work: receipt → code → balance
-            with ThreadPoolExecutor(max_workers=max_workers) as exe:
-                futures = [
-                    exe.submit(_process_tx, tx_hash, rr_w3, seen_contracts)
-                    for tx_hash in tx_hashes
-                ]
+async def watch_new_contracts(rpc_entries, from_block=None, poll_interval=2, max_in_flight=None):
+    """
+    Async generator that yields (contract_address, balance_wei) for any newly‐deployed contract
+    whose balance > 0.1 ETH.
+
+    Parameters:
+      rpc_entries   – list of either URL‐strings or (name, url) tuples
+      from_block    – if None, starts from latest block at call time; else start from that block number
+      poll_interval – seconds between eth_getFilterChanges polls (HTTP only; also the
+                      websocket reconnect delay)
+      max_in_flight – max concurrent JSON‐RPC requests across all endpoints. Defaults to _MAX_IN_FLIGHT.
+
+    Internally:
+      • Learns about new blocks by push where possible: eth_subscribe("newHeads") if any entry is
+        a wss:// URL, otherwise an eth_newBlockFilter polled with eth_getFilterChanges (see
+        _ws_heads/_http_heads), rather than polling eth_blockNumber.
+      • Keeps one HTTP/2 httpx.AsyncClient per http(s) RPC URL and rotates through them in
+        round‐robin fashion, to spread the JSON‐RPC load.
+      • Fetches every receipt of a block with one eth_getBlockReceipts call. Endpoints that
+        don’t implement it fall back to eth_getBlockByNumber (full transactions), keep only the
+        contract creations (tx.to is None) client‐side, and batch eth_getTransactionReceipt for those.
+      • Only contract creations (receipt.contractAddress) are candidates; calls to existing
+        contracts are ignored.
+      • Collects the block’s unseen candidate addresses once, then issues one eth_getCode batch
+        for all of them and one eth_getBalance batch for those that turned out to be contracts.
+      • Batches larger than _BATCH_SIZE are split and sent to several endpoints concurrently
+        with asyncio.gather, all on a single thread.
+      • Keeps a seen_contracts set so each contract is reported only once ever; an address
+        is only added once it has been confirmed (code + balance), right before it’s yielded.
+    """
+    if not rpc_entries:
+        raise ValueError("`rpc_entries` must be a non‐empty list of URLs or (name,url) tuples.")
+
+    # Websocket URLs are only used for head subscriptions; batches need HTTP endpoints
+    ws_urls = [
+        _entry_url(entry) for entry in rpc_entries
+        if _entry_url(entry).startswith(("wss://", "ws://"))
+    ]
+    http_entries = [entry for entry in rpc_entries if _entry_url(entry) not in ws_urls]
+    if not http_entries:
+        raise ValueError("`rpc_entries` needs at least one http(s) URL for JSON‐RPC batches.")
+
+    # Build a round‐robin iterator over (url, client) pairs
+    endpoints = _make_endpoints(http_entries)
+    rr_endpoints = itertools.cycle(endpoints)
+
+    sem = asyncio.Semaphore(max_in_flight or _MAX_IN_FLIGHT)
+
+    # Contracts already reported, as raw 20‐byte addresses (see _address_key). Candidates only
+    # come from creation receipts, so this just stops a re-processed block (e.g. after a reorg)
+    # from reporting the same creation twice. Only this generator writes to it, so it needs no
+    # lock, and nothing is ever discarded.
+    seen_contracts = set()
+    # Endpoints that answered eth_getBlockReceipts with "method not found"
+    no_block_receipts = set()
 
-                for fut in as_completed(futures):
-                    result = fut.result()
-                    if result is not None:
-                        # result is (addr_checksum, balance_wei)
-                        yield result
+    heads = None
+    try:
+        # Determine starting block number
+        try:
+            latest = int(await _rpc_call(next(rr_endpoints), "eth_blockNumber", []), 16)
+        except Exception as e:
+            raise RuntimeError(f"Unable to fetch latest block from any RPC: {e}")
 
-        # Update the “current” pointer so we don’t re‐scan these blocks
-        current = latest
+        current = from_block if (from_block is not None) else latest
+
+        if ws_urls:
+            heads = _ws_heads(ws_urls[0], poll_interval)
+        else:
+            heads = _http_heads(rr_endpoints, poll_interval)
 
+        # Main loop: one iteration per new chain head
+        async for latest in heads:
+            if latest <= current:
+                continue
 
-def _process_tx(tx_hash, rr_w3, seen_contracts):
+            # Process each new block in range(current+1 .. latest)
+            for block_number in range(current + 1, latest + 1):
+                endpoint = next(rr_endpoints)
+                receipts = None
+                if endpoint[0] not in no_block_receipts:
+                    try:
+                        receipts = await _rpc_call(endpoint, "eth_getBlockReceipts", [hex(block_number)])
+                    except _MethodNotFound:
+                        no_block_receipts.add(endpoint[0])
+                    except Exception:
+                        # Skip this block if the call fails
+                        continue
+
+                if receipts is None:
+                    try:
+                        block = await _rpc_call(
+                            next(rr_endpoints), "eth_getBlockByNumber", [hex(block_number), True]
+                        )
+                    except Exception:
+                        # Skip this block if the call fails
+                        continue
+                    if not block:
+                        continue
+
+                    # Only contract creations have a receipt worth fetching
+                    tx_hashes = [tx["hash"] for tx in block["transactions"] if tx.get("to") is None]
+                    receipts = await _rpc_batch_chunked(
+                        rr_endpoints, sem,
+                        [("eth_getTransactionReceipt", [h]) for h in tx_hashes],
+                    )
+
+                # EIP‐55 checksumming costs a keccak, so it’s only done for reported contracts
+                for addr, balance in await _check_candidates(rr_endpoints, sem, receipts, seen_contracts):
+                    seen_contracts.add(_address_key(addr))
+                    yield (Web3.to_checksum_address(addr), balance)
+
+            # Update the “current” pointer so we don’t re‐scan these blocks
+            current = latest
+    finally:
+        if heads is not None:
+            await heads.aclose()
+        await asyncio.gather(*[client.aclose() for _, client in endpoints])
+
+
+def _address_key(addr):
     """
-    For a single tx_hash:
-      • get_transaction_receipt
-      • determine contractAddress or receipt.to
-      • if not seen, get_code → get_balance
-      • if code != b"" and balance > 0.1 ETH, add to seen_contracts and return (address, balance)
-      • otherwise return None
+    Raw 20‐byte form of a "0x…" address, used as the seen_contracts key: about half the
+    memory of the 42‐char string and cheaper to hash, which adds up over a long‐running watch.
     """
-    w3 = next(rr_w3)
-    try:
-        receipt = w3.eth.get_transaction_receipt(tx_hash)
-    except Exception:
-        return None
-
-    # If it’s a contract creation, use receipt.contractAddress; else use receipt.to
-    addr = None
-    if receipt.contractAddress:
-        addr = Web3.to_checksum_address(receipt.contractAddress)
-    elif receipt.to:
-        addr = Web3.to_checksum_address(receipt.to)
-
-    if not addr:
-        return None
-
-    # Skip if already seen
-    with _seen_lock():
-        if addr in seen_contracts:
-            return None
-        # Temporarily mark as seen so parallel threads don’t re-add
-        seen_contracts.add(addr)
-
-    # Fetch code; if empty, it’s not a contract
-    w3_code = next(rr_w3)
-    try:
-        code = w3_code.eth.get_code(addr)
-    except Exception:
-        # On error, un‐mark and bail
-        with _seen_lock():
-            seen_contracts.discard(addr)
-        return None
-
-    if code == b"":
-        with _seen_lock():
-            seen_contracts.discard(addr)
-        return None
-
-    # Fetch balance
-    w3_bal = next(rr_w3)
-    try:
-        balance = w3_bal.eth.get_balance(addr)
-    except Exception:
-        with _seen_lock():
-            seen_contracts.discard(addr)
-        return None
+    return bytes.fromhex(addr[2:])
 
-    # Only report if > 0.1 ETH
-    if balance > int(0.1 * 1e18):
-        return (addr, balance)
 
-    # If balance too low, remove so that a later deposit can re-trigger
-    with _seen_lock():
-        seen_contracts.discard(addr)
-    return None
+async def _check_candidates(rr_endpoints, sem, receipts, seen_contracts):
+    """
+    For one block’s receipts:
+      • take receipt.contractAddress of every contract creation, deduplicated
+      • drop addresses already in seen_contracts
+      • one (chunked) batch of eth_getCode for every remaining address
+      • one (chunked) batch of eth_getBalance for those whose code != "0x"
+    Returns a list of (lowercase_address, balance) tuples whose balance > 0.1 ETH.
+    Each contract is only checked in the block that created it: one that fails a check
+    there (e.g. funded later, not in its constructor) is never reported, because later
+    deposits don't produce a creation receipt to bring it back.
+    """
+    # Only contract creations carry a contractAddress; plain transfers and calls are skipped
+    # (a dict keeps first‐seen order while deduplicating)
+    candidates = {}
+    for receipt in receipts:
+        if not receipt:
+            continue
+        raw = receipt.get("contractAddress")
+        if not raw:
+            continue
+
+        key = _address_key(raw)
+        if key not in seen_contracts:
+            candidates[key] = raw.lower()
+    candidates = list(candidates.values())
 
+    if not candidates:
+        return []
 
-# Module‐level lock to protect seen_contracts
-_seen_lock_obj = Lock()
-def _seen_lock():
-    return _seen_lock_obj
+    # Empty code means it’s not a contract
+    codes = await _rpc_batch_chunked(
+        rr_endpoints, sem, [("eth_getCode", [addr, "latest"]) for addr in candidates]
+    )
+    contracts = [
+        addr for addr, code in zip(candidates, codes) if code not in (None, "0x")
+    ]
+    if not contracts:
+        return []
+
+    balances = await _rpc_batch_chunked(
+        rr_endpoints, sem, [("eth_getBalance", [addr, "latest"]) for addr in contracts]
+    )
+
+    # Only report if > 0.1 ETH
+    found = []
+    for addr, balance in zip(contracts, balances):
+        if balance is None:
+            continue
+        balance = int(balance, 16)
+        if balance > _MIN_WEI:
+            found.append((addr, balance))
+    return found
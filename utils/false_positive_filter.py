@@ -2,72 +2,219 @@
 
 import os
 import re
+from functools import lru_cache
+from threading import Lock
+from typing import NamedTuple
 
-def is_nonpublic(source_dir: str, function_name: str) -> bool:
+try:
+    # Optional: Intel Hyperscan's SIMD matcher finds declaration sites much faster than `re`
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+
+def _sources_mtime(source_dir: str) -> int | None:
     """
-    Returns True if `function_name` is declared `private` or `internal` in any .sol file
-    under source_dir.
+    Newest mtime (ns) of source_dir, its subdirectories and every .sol file under them, or
+    None if source_dir doesn't exist. A directory's own mtime only moves when entries are
+    added/removed/renamed in it, so the files are stat'ed too to catch in-place rewrites.
     """
-    if not function_name:
-        return False
+    newest = None
+    for root, _, files in os.walk(source_dir):
+        paths = [root] + [os.path.join(root, f) for f in files if f.endswith(".sol")]
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            if newest is None or mtime > newest:
+                newest = mtime
+    return newest
 
-    pattern = re.compile(
-        rf"function\s+{re.escape(function_name)}\b[^\)]*\)\s+(private|internal)\b",
-        re.IGNORECASE
-    )
 
+@lru_cache(maxsize=128)
+def _read_sources_cached(source_dir: str, mtime: int) -> tuple[str, ...]:
+    # Contents of every .sol file under source_dir, one entry per file. Keyed by
+    # _sources_mtime() so editing, adding or removing any .sol file invalidates it.
+    codes = []
     for root, _, files in os.walk(source_dir):
         for fname in files:
             if not fname.endswith(".sol"):
                 continue
             path = os.path.join(root, fname)
             try:
-                code = open(path, "r", encoding="utf-8").read()
+                with open(path, "r", encoding="utf-8") as f:
+                    codes.append(f.read())
             except Exception:
                 continue
+    return tuple(codes)
+
 
-            if pattern.search(code):
-                return True
+# One pass over a file finds every function declaration: name, parameter list, and the
+# header between `)` and the opening `{` (visibility, mutability, modifiers, returns).
+# Bodiless declarations (interfaces, abstract functions) end in `;` and are skipped.
+# Solidity identifiers are ASCII, so re.ASCII keeps \w/\s/\b off the Unicode tables.
+_FUNCTION_DECL = re.compile(r"\bfunction\s+(\w+)\s*\([^\)]*\)([^\{;]*)\{", re.ASCII)
 
-    return False
+_VISIBILITY = re.compile(r"\b(public|external|internal|private)\b", re.ASCII)
 
+_GUARD_MODIFIERS = re.compile(r"\b(onlyOwner|onlyAdmin|onlyRole)\b", re.IGNORECASE)
 
-def has_modifier_guard(source_dir: str, function_name: str) -> bool:
+_OWNER_CHECK_PATTERNS = (
+    re.compile(r"msg\.sender\s*==\s*owner", re.IGNORECASE),
+    re.compile(r"owner\s*==\s*msg\.sender", re.IGNORECASE),
+    # Catch OZ AccessControl style: `require(hasRole(ADMIN_ROLE, msg.sender))`
+    re.compile(r"hasRole\s*\(", re.IGNORECASE),
+)
+
+
+# Tokens that matter while brace-matching a body: braces, string openers, comment openers
+_BODY_TOKEN = re.compile(r"[{}\"']|//|/\*")
+
+# Rest of a string literal after its opening quote, honoring backslash escapes
+_STRING_TAIL = {
+    '"': re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL),
+    "'": re.compile(r"(?:[^'\\]|\\.)*'", re.DOTALL),
+}
+
+
+def _extract_body(code: str, start: int) -> str:
+    """
+    Starting from the open brace at `start`, returns everything up to its matching closing brace
+    (or to the end of `code` if it never closes). Braces inside string literals and
+    comments don't count. Jumps from token to token and slices once at the end.
     """
-    Returns True if `function_name` has an `onlyOwner`, `onlyAdmin`, or `onlyRole` modifier
-    in its declaration line under any .sol file in source_dir.
+    depth = 0
+    pos = start
+    while True:
+        match = _BODY_TOKEN.search(code, pos)
+        if not match:
+            return code[start:]
+        token = match.group()
+        pos = match.end()
+
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return code[start:pos]
+        elif token == "//":
+            end = code.find("\n", pos)
+            if end == -1:
+                return code[start:]
+            pos = end + 1
+        elif token == "/*":
+            end = code.find("*/", pos)
+            if end == -1:
+                return code[start:]
+            pos = end + 2
+        else:
+            tail = _STRING_TAIL[token].match(code, pos)
+            if not tail:
+                return code[start:]
+            pos = tail.end()
+
+
+if hyperscan is not None:
+    # Every "function<ws>" keyword reports exactly one match, ending after the whitespace
+    _HS_KEYWORD_LEN = len("function ")
+    _HS_DB = hyperscan.Database()
+    _HS_DB.compile(expressions=[rb"\bfunction\s"], ids=[0], elements=1, flags=[0])
+    # A Database owns a single scratch space, so scans must not overlap across threads
+    _HS_LOCK = Lock()
+
+
+def _find_declarations(code: str):
     """
-    if not function_name:
-        return False
+    Yields a _FUNCTION_DECL match for every function declaration in `code`.
 
-    # Look for lines like:
-    #   function fnName(...) public onlyOwner { ... }
-    #   function fnName(...) external onlyAdmin { ... }
-    #   function fnName(...) external onlyRole(ADMIN) { ... }
-    pattern = re.compile(
-        rf"function\s+{re.escape(function_name)}\b[^\)]*\)\s*(public|external)\s+(onlyOwner|onlyAdmin|onlyRole)\b",
-        re.IGNORECASE
-    )
+    With hyperscan installed, ASCII sources (byte offsets == str indices) are scanned
+    once for the `function` keyword and the full pattern is only matched, anchored,
+    at those spots; otherwise it falls back to re.finditer.
+    """
+    if hyperscan is None or not code.isascii():
+        yield from _FUNCTION_DECL.finditer(code)
+        return
 
-    for root, _, files in os.walk(source_dir):
-        for fname in files:
-            if not fname.endswith(".sol"):
-                continue
-            path = os.path.join(root, fname)
-            try:
-                code = open(path, "r", encoding="utf-8").read()
-            except Exception:
-                continue
+    starts = []
+
+    def _on_match(_id, _start, end, _flags, _context):
+        starts.append(end - _HS_KEYWORD_LEN)
+
+    with _HS_LOCK:
+        _HS_DB.scan(code.encode("ascii"), match_event_handler=_on_match)
+
+    for start in starts:
+        match = _FUNCTION_DECL.match(code, start)
+        if match:
+            yield match
+
+
+class FunctionInfo(NamedTuple):
+    # public/external/internal/private ("public" when omitted, as in pre-0.5 Solidity)
+    visibility: str
+    header: str      # text between the parameter list and the opening brace (modifiers live here)
+    body: str        # from `{` to its matching `}`
 
-            if pattern.search(code):
-                return True
 
-    return False
+@lru_cache(maxsize=256)
+def _index_sources(source_dir: str, mtime: int) -> dict[str, list[FunctionInfo]]:
+    index: dict[str, list[FunctionInfo]] = {}
+    for code in _read_sources_cached(source_dir, mtime):
+        for match in _find_declarations(code):
+            name, header = match.group(1), match.group(2)
+            vis = _VISIBILITY.search(header)
+            visibility = vis.group(1) if vis else "public"
+            body = _extract_body(code, match.end() - 1)  # position of "{"
+            index.setdefault(name, []).append(FunctionInfo(visibility, header, body))
+    return index
 
 
-def has_manual_owner_check(source_dir: str, function_name: str) -> bool:
+def build_function_index(source_dir: str) -> dict[str, list[FunctionInfo]]:
     """
-    Returns True if, inside the body of `function_name`, there is a check like
+    Reads every .sol file under source_dir once and returns
+    {function_name: [FunctionInfo(visibility, header, body), ...]} with one entry per
+    declaration (overloads and same-named functions in other contracts each get their own).
+
+    The index is memoized per source_dir and the newest mtime of its .sol files (see
+    _sources_mtime), so repeat calls for an unchanged contract are dict lookups while an
+    edited, added or removed file triggers a rebuild. It is shared: don't mutate it.
+    Pass it to the filters below.
+    """
+    mtime = _sources_mtime(source_dir)
+    if mtime is None:
+        return {}
+    return _index_sources(source_dir, mtime)
+
+
+def is_nonpublic(index: dict, function_name: str) -> bool:
+    """
+    Returns True if `function_name` is declared `private` or `internal` anywhere in the
+    function index built by build_function_index().
+    """
+    return any(
+        info.visibility in ("private", "internal")
+        for info in index.get(function_name, ())
+    )
+
+
+def has_modifier_guard(index: dict, function_name: str) -> bool:
+    """
+    Returns True if a public/external declaration of `function_name` carries an
+    `onlyOwner`, `onlyAdmin`, or `onlyRole` modifier, e.g.:
+      function fnName(...) public onlyOwner { ... }
+      function fnName(...) external onlyRole(ADMIN) { ... }
+    """
+    return any(
+        info.visibility in ("public", "external") and _GUARD_MODIFIERS.search(info.header)
+        for info in index.get(function_name, ())
+    )
+
+
+def has_manual_owner_check(index: dict, function_name: str) -> bool:
+    """
+    Returns True if, inside the body of a public/external `function_name`, there is a check like
     `require(msg.sender == owner)` or similar patterns. This catches manual owner checks
     that Slither’s `has_modifier_guard` would miss.
 
@@ -76,54 +223,31 @@ def has_manual_owner_check(source_dir: str, function_name: str) -> bool:
       - `require(msg.sender == owner` (anywhere in the function body)
       - `hasRole(` (common OpenZeppelin AccessControl pattern)
     """
-    if not function_name:
-        return False
-
-    # Roughly match the function definition and capture its body up to the matching brace.
-    # This is a simplistic approach and may break on deeply nested braces,
-    # but it works in most flattened sources.
-    func_block_pattern = re.compile(
-        rf"function\s+{re.escape(function_name)}\b[^\)]*\)\s*(public|external)\s*[^\{{]*\{{",
-        re.IGNORECASE
+    return any(
+        info.visibility in ("public", "external")
+        and any(p.search(info.body) for p in _OWNER_CHECK_PATTERNS)
+        for info in index.get(function_name, ())
     )
 
-    for root, _, files in os.walk(source_dir):
-        for fname in files:
-            if not fname.endswith(".sol"):
-                continue
-            path = os.path.join(root, fname)
-            try:
-                code = open(path, "r", encoding="utf-8").read()
-            except Exception:
-                continue
 
-            # Find the start index of "function fnName(...) {..."
-            match = func_block_pattern.search(code)
-            if not match:
-                continue
+# classify_functions() bit flags; a function with no flags set passed every filter
+NONPUBLIC  = 1  # declared private/internal somewhere (is_nonpublic)
+GUARDED    = 2  # public/external with an onlyOwner/onlyAdmin/onlyRole modifier (has_modifier_guard)
+OWNERCHECK = 4  # public/external with an in-body owner/role check (has_manual_owner_check)
 
-            # Starting from the open brace of this function, extract until the matching closing brace.
-            start = match.end() - 1  # position of "{"
-            brace_counter = 0
-            body = ""
-            for i in range(start, len(code)):
-                c = code[i]
-                body += c
-                if c == "{":
-                    brace_counter += 1
-                elif c == "}":
-                    brace_counter -= 1
-                    if brace_counter == 0:
-                        break
-
-            # Now `body` contains everything from that first "{" to its matching "}".
-            # Look for patterns inside that snippet:
-            if re.search(r"msg\.sender\s*==\s*owner", body, re.IGNORECASE):
-                return True
-            if re.search(r"owner\s*==\s*msg\.sender", body, re.IGNORECASE):
-                return True
-            # Catch OZ AccessControl style: `require(hasRole(ADMIN_ROLE, msg.sender))`
-            if re.search(r"hasRole\s*\(", body, re.IGNORECASE):
-                return True
-
-    return False
+
+def classify_functions(source_dir: str, function_names) -> dict[str, int]:
+    """
+    Runs all three filters above for every name in `function_names` off a single
+    build_function_index() of source_dir. Returns {function_name: flags}, where flags
+    ORs together NONPUBLIC, GUARDED and OWNERCHECK (0 = public and unguarded).
+    """
+    index = build_function_index(source_dir)
+    flags: dict[str, int] = {}
+    for fn in function_names:
+        flags[fn] = (
+            (NONPUBLIC if is_nonpublic(index, fn) else 0)
+            | (GUARDED if has_modifier_guard(index, fn) else 0)
+            | (OWNERCHECK if has_manual_owner_check(index, fn) else 0)
+        )
+    return flags
@@ -1,20 +1,69 @@
 # utils/node_finder.py
 
+import asyncio
+import json
+import os
 import requests
+import httpx
 import time
-import json
-from threading import Thread, Lock
-from queue import Queue, Empty
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from bs4 import BeautifulSoup, FeatureNotFound
 from web3 import Web3
 
 ETH_NODES_URL = "https://ethereumnodes.com/"
 
+# Scraped node list is kept on disk for a day so short-lived runs skip the scrape
+NODES_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "contractsniffer", "nodes.json")
+NODES_CACHE_TTL = 24 * 60 * 60
+
+# One Web3 per (url, timeout): its HTTPProvider keeps a keep-alive session, so repeated
+# probes of the same endpoint skip the TCP/TLS handshake
+_W3_CACHE: dict[tuple[str, int], Web3] = {}
+
+def _get_w3(url, timeout=5):
+    key = (url, timeout)
+    w3 = _W3_CACHE.get(key)
+    if w3 is None:
+        w3 = _W3_CACHE.setdefault(
+            key, Web3(Web3.HTTPProvider(url, request_kwargs={"timeout": timeout}))
+        )
+    return w3
+
 # 1. Scrape all HTTPS/HTTP endpoints from ethereumnodes.com
+@lru_cache(maxsize=1)
 def _get_https_nodes():
+    """
+    Returns [(name, url), ...], from the on-disk cache if it's younger than
+    NODES_CACHE_TTL, otherwise freshly scraped (and written back to the cache).
+    """
+    try:
+        if time.time() - os.path.getmtime(NODES_CACHE_PATH) < NODES_CACHE_TTL:
+            with open(NODES_CACHE_PATH, "r", encoding="utf-8") as f:
+                nodes = [tuple(node) for node in json.load(f)]
+            if nodes:
+                return nodes
+    except (OSError, ValueError):
+        pass
+
+    nodes = _scrape_https_nodes()
+    if nodes:
+        try:
+            os.makedirs(os.path.dirname(NODES_CACHE_PATH), exist_ok=True)
+            with open(NODES_CACHE_PATH, "w", encoding="utf-8") as f:
+                json.dump(nodes, f)
+        except OSError:
+            pass
+    return nodes
+
+def _scrape_https_nodes():
     resp = requests.get(ETH_NODES_URL, timeout=5)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    try:
+        # libxml2-backed parser, several times faster than the pure-Python one
+        soup = BeautifulSoup(resp.text, "lxml")
+    except FeatureNotFound:
+        soup = BeautifulSoup(resp.text, "html.parser")
 
     nodes = []
     for li in soup.select("ul > li"):
@@ -35,7 +84,7 @@ def _measure_latency(name, url, timeout=5):
     Returns (name, url, latency_ms) or (name, url, None) on failure.
     """
     try:
-        w3 = Web3(Web3.HTTPProvider(url, request_kwargs={"timeout": timeout}))
+        w3 = _get_w3(url, timeout)
         start = time.monotonic()
         _ = w3.eth.block_number
         elapsed = (time.monotonic() - start) * 1000
@@ -44,66 +93,40 @@ def _measure_latency(name, url, timeout=5):
         return (name, url, None)
 
 # 3. Burst / rate-limit probing
+async def _fire_burst(url, burst, timeout, rpc_method):
+    """
+    Fires `burst` JSON-RPC calls (method=rpc_method, no params) at once over one
+    HTTP/2 connection. Returns (success_count, total_time_sec); a call counts as a
+    success if it got HTTP 200 and no JSON-RPC error.
+    """
+    async with httpx.AsyncClient(http2=True, timeout=timeout) as client:
+        async def _one(i):
+            payload = {"jsonrpc": "2.0", "method": rpc_method, "params": [], "id": i}
+            try:
+                resp = await client.post(url, json=payload)
+                return resp.status_code == 200 and "error" not in resp.json()
+            except Exception:
+                return False
+
+        start = time.monotonic()
+        results = await asyncio.gather(*[_one(i) for i in range(1, burst + 1)])
+        total = time.monotonic() - start
+
+    return sum(results), total
+
 def _probe_rate_limit(name, url, burst=50, timeout=5, rpc_method="eth_blockNumber"):
     """
-    Sends up to `burst` rapid JSON-RPC calls (method=rpc_method, no params),
-    stops on HTTP error or JSON-RPC error, or after `burst` successes.
+    Sends `burst` concurrent JSON-RPC calls (method=rpc_method, no params),
+    multiplexed over HTTP/2, and counts how many succeed.
     Returns (name, url, latency_ms, success_count, total_time_sec).
     """
     # First, measure latency once
     _, _, latency_ms = _measure_latency(name, url, timeout)
 
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "jsonrpc": "2.0",
-        "method": rpc_method,
-        "params": [],
-        "id": 1
-    }
-
-    session = requests.Session()
-    session.headers.update(headers)
-    start = time.monotonic()
-    success_count = 0
-
-    for i in range(1, burst + 1):
-        payload["id"] = i
-        try:
-            resp = session.post(url, data=json.dumps(payload), timeout=timeout)
-            if resp.status_code != 200:
-                break
-            js = resp.json()
-            if "error" in js:
-                break
-            success_count += 1
-        except Exception:
-            break
-
-    total = time.monotonic() - start
+    # Runs in a worker thread, so it gets its own event loop
+    success_count, total = asyncio.run(_fire_burst(url, burst, timeout, rpc_method))
     return (name, url, latency_ms, success_count, total)
 
-def _worker_latency(queue, results, lock):
-    while True:
-        try:
-            name, url = queue.get_nowait()
-        except Empty:
-            return
-        res = _measure_latency(name, url)
-        with lock:
-            results.append(res)
-        queue.task_done()
-
-def _worker_rate(queue, results, lock, burst, timeout):
-    while True:
-        try:
-            name, url = queue.get_nowait()
-        except Empty:
-            return
-        res = _probe_rate_limit(name, url, burst, timeout)
-        with lock:
-            results.append(res)
-        queue.task_done()
-
 def get_working_public_nodes(burst: int = 50,
                              top_n: int = 5,
                              timeout: int = 5) -> list[tuple[str, str]]:
@@ -112,6 +135,7 @@ def get_working_public_nodes(burst: int = 50,
     then probes the top `top_n` for rate-limit capacity using a `burst` of rapid calls.
 
     Returns a list of (name, url) for all endpoints that passed the full burst (i.e., success_count == burst).
+    `timeout` (seconds) applies to both the latency pass and the burst probes.
     """
     # 1) scrape all HTTPS nodes
     all_nodes = _get_https_nodes()
@@ -119,19 +143,10 @@ def get_working_public_nodes(burst: int = 50,
         raise RuntimeError("No HTTPS nodes found on ethereumnodes.com")
 
     # 2) measure latency for each node (multithreaded)
-    latency_results = []
-    lat_lock = Lock()
-    latency_queue = Queue()
-    for item in all_nodes:
-        latency_queue.put(item)
-
-    threads = []
-    for _ in range(min(10, len(all_nodes))):
-        t = Thread(target=_worker_latency, args=(latency_queue, latency_results, lat_lock))
-        t.daemon = True
-        t.start()
-        threads.append(t)
-    latency_queue.join()
+    with ThreadPoolExecutor(max_workers=min(32, len(all_nodes))) as pool:
+        # Same timeout as the probes below, so _probe_rate_limit's re-measure reuses this
+        # pass's cached Web3 session (see _get_w3) instead of opening a new connection
+        latency_results = list(pool.map(lambda node: _measure_latency(*node, timeout), all_nodes))
 
     # filter out nodes that failed latency
     responsive = [(n, u, ms) for n, u, ms in latency_results if ms is not None]
@@ -143,23 +158,11 @@ def get_working_public_nodes(burst: int = 50,
     # pick top N (by default, 5)
     top_nodes = [(n, u) for n, u, _ in responsive][:top_n]
 
-    # 3) probe rate-limit on top_nodes
-    rate_queue = Queue()
-    for item in top_nodes:
-        rate_queue.put(item)
-
-    rate_results = []
-    rate_lock = Lock()
-    threads = []
-    for _ in range(len(top_nodes)):
-        t = Thread(
-            target=_worker_rate,
-            args=(rate_queue, rate_results, rate_lock, burst, timeout)
-        )
-        t.daemon = True
-        t.start()
-        threads.append(t)
-    rate_queue.join()
+    # 3) probe rate-limit on top_nodes, all in parallel
+    with ThreadPoolExecutor(max_workers=len(top_nodes)) as pool:
+        rate_results = list(pool.map(
+            lambda node: _probe_rate_limit(*node, burst, timeout), top_nodes
+        ))
 
     # 4) collect those that passed the full burst (success_count == burst)
     working = []
@@ -1,129 +1,381 @@
 # utils/slither_analyzer.py
 
 import subprocess
+import asyncio
 import json
+import logging
 import os
-import re
+import shutil
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import compress
 
-# Make sure these two functions exist in utils/false_positive_filter.py:
-#    is_nonpublic(source_dir, function_name) → bool
-#    has_modifier_guard(source_dir, function_name) → bool
-#    has_manual_owner_check(source_dir, function_name) → bool
+try:
+    # Optional: ijson streams detectors one at a time instead of loading the whole report
+    import ijson
+except ImportError:
+    ijson = None
 
-from utils.false_positive_filter import (
-    is_nonpublic,
-    has_modifier_guard,
-    has_manual_owner_check,
+try:
+    # Optional: orjson's C parser decodes large Slither reports several times faster
+    import orjson
+except ImportError:
+    orjson = None
+
+# Make sure this function exists in utils/false_positive_filter.py:
+#    classify_functions(source_dir, function_names) → {function_name: NONPUBLIC|GUARDED|OWNERCHECK flags}
+
+from utils.false_positive_filter import classify_functions
+from utils.source_checker import get_source_hashes
+
+
+log = logging.getLogger("contractsniffer.slither")
+
+
+# Slither settings shared by the CLI path below and the in-process worker (utils/slither_worker.py)
+DETECTORS     = "arbitrary-send-eth,reentrancy-eth,incorrect-return"
+EXCLUDE_PATHS = r".*SafeMath\.sol|.*openzeppelin/.*|.*libraries/.*"
+SOLC_ARGS     = "--via-ir --optimize --allow-paths C:/Users/haych/Desktop/ContractSniffer"
+
+# Resolved once so each run doesn't repeat the PATH (and, on Windows, PATHEXT) search
+_SLITHER_BIN = shutil.which("slither") or "slither"
+
+# Every CLI flag that doesn't depend on the contract, built once at import
+_SLITHER_STATIC = (
+    "--detect", DETECTORS,
+    "--exclude-detectors", "solidity-safemath,arithmetic",
+    "--exclude-paths", EXCLUDE_PATHS,
+    "--solc-args", SOLC_ARGS,
 )
 
+# On-disk memo of finished Slither runs: "<chain_slug>:<address>" → Etherscan source hash
+_CACHE_DB = "slither-reports/cache.sqlite"
+
+
+def report_path(address: str) -> str:
+    """Where Slither's JSON report for `address` lives (CLI and in-process runs alike)."""
+    return f"slither-reports/{address}.json"
+
+
+def _cached_source_hash(key: str) -> str | None:
+    if not os.path.isfile(_CACHE_DB):
+        return None
+    with closing(sqlite3.connect(_CACHE_DB)) as db:
+        row = db.execute("SELECT source_hash FROM reports WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _store_source_hash(key: str, source_hash: str) -> None:
+    os.makedirs(os.path.dirname(_CACHE_DB), exist_ok=True)
+    with closing(sqlite3.connect(_CACHE_DB)) as db, db:
+        db.execute("CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, source_hash TEXT)")
+        db.execute("INSERT OR REPLACE INTO reports VALUES (?, ?)", (key, source_hash))
+
+
+def _report_is_fresh(address: str) -> bool:
+    # Report exists and is at least as new as the sources Slither exported for it
+    report = report_path(address)
+    src = f"crytic-export/etherscan-contracts/{address}"
+    return os.path.isfile(report) and (
+        not os.path.isdir(src) or os.path.getmtime(report) >= os.path.getmtime(src)
+    )
+
+
+def report_is_cached(chain_slug: str, address: str, source_hash: str | None) -> bool:
+    """
+    True if slither-reports/<address>.json exists and was built from the source with
+    `source_hash` (see utils.source_checker.get_source_hash).
+    Without a `source_hash`, falls back to the report being newer than the exported sources.
+    """
+    if not source_hash:
+        return _report_is_fresh(address)
+    return bool(
+        os.path.isfile(report_path(address))
+        and _cached_source_hash(f"{chain_slug}:{address}") == source_hash
+    )
+
+
+def remember_report(chain_slug: str, address: str, source_hash: str | None) -> None:
+    """Records that slither-reports/<address>.json was built from the source with `source_hash`."""
+    if source_hash and os.path.isfile(report_path(address)):
+        _store_source_hash(f"{chain_slug}:{address}", source_hash)
+
+
+def _slither_cmd(chain_slug: str, address: str) -> list[str]:
+    return [_SLITHER_BIN, f"{chain_slug}:{address}", *_SLITHER_STATIC, "--json", report_path(address)]
 
-def run_slither(chain_slug: str, address: str) -> bool:
+
+def clear_report(address: str) -> None:
+    """
+    Deletes slither-reports/<address>.json ahead of a (re-)run. Slither's --json and
+    output_to_json won't overwrite an existing file, so without this a re-run for a new
+    source, a stale report or force=True leaves the old findings (and old mtime) in place.
+    """
+    report = report_path(address)
+    os.makedirs(os.path.dirname(report), exist_ok=True)
+    try:
+        os.remove(report)
+    except FileNotFoundError:
+        pass
+
+
+def _log_slither_outcome(address: str, returncode: int, stderr: bytes) -> None:
+    if returncode != 0 or stderr:
+        log.warning("[⚠️] Slither reported issues or warnings for %s", address)
+        if log.isEnabledFor(logging.DEBUG):
+            # stderr stays raw bytes; only decode a short excerpt, and only when it will be shown
+            log.debug("Slither stderr for %s: %s", address, stderr[:200].decode("utf-8", "replace"))
+    else:
+        log.info("[✅] Slither ran clean (no issues) for %s", address)
+
+
+def _finish_run(chain_slug: str, address: str, source_hash: str | None,
+                returncode: int, stderr: bytes) -> bool:
+    # Shared tail of a CLI run: log it, and tie source_hash to the report. clear_report() ran
+    # first, so any report on disk was written by this run. The exit status is no guide:
+    # Slither exits non-zero whenever a detector fires (--fail-on defaults to pedantic).
+    _log_slither_outcome(address, returncode, stderr)
+    if not os.path.isfile(report_path(address)):
+        log.error("[❌] Slither wrote no report for %s", address)
+        return False
+    remember_report(chain_slug, address, source_hash)
+    return True
+
+
+def run_slither(chain_slug: str, address: str, source_hash: str | None = None,
+                force: bool = False) -> bool:
     """
     Invokes Slither on chain_slug:address, but only detects the high-value patterns.
-    Returns True if Slither completed (even with warnings), False on subprocess error.
-    """
-    print(f"[🔎] Running Slither on {chain_slug}:{address}")
-
-    cmd = [
-        "slither",
-        f"{chain_slug}:{address}",
-        "--detect", "arbitrary-send-eth,reentrancy-eth,incorrect-return",
-        "--exclude-detectors", "solidity-safemath,arithmetic",
-        "--exclude-paths", r".*SafeMath\.sol|.*openzeppelin/.*|.*libraries/.*",
-        "--solc-args", "--via-ir --optimize --allow-paths C:/Users/haych/Desktop/ContractSniffer",
-        "--json", f"slither-reports/{address}.json",
-    ]
+    Returns True if Slither completed and wrote its report (even with warnings),
+    False on subprocess error or when no report came out.
+
+    If `source_hash` (see utils.source_checker.get_source_hash) matches the one recorded
+    for the existing slither-reports/<address>.json, that report is reused and Slither
+    is skipped; a re-verified source has a new hash and gets re-analyzed. Without a
+    `source_hash`, an existing report newer than the exported sources is reused.
+    Pass force=True to always re-run Slither. Either way a re-run replaces the old report.
+    """
+    if not force and report_is_cached(chain_slug, address, source_hash):
+        log.info("[♻️] Reusing cached Slither report for %s:%s", chain_slug, address)
+        return True
+
+    log.info("[🔎] Running Slither on %s:%s", chain_slug, address)
+    clear_report(address)
 
     try:
+        # Nothing reads Slither's stdout (the report goes to --json), so don't buffer it
         proc = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
+            _slither_cmd(chain_slug, address),
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE,
-            text=True
         )
     except Exception as e:
-        print(f"[❌] Slither subprocess error for {address}: {e}")
+        log.error("[❌] Slither subprocess error for %s: %s", address, e)
         return False
 
-    if proc.stderr:
-        print(f"[⚠️] Slither reported issues or warnings for {address}")
-    else:
-        print(f"[✅] Slither ran clean (no issues) for {address}")
+    return _finish_run(chain_slug, address, source_hash, proc.returncode, proc.stderr)
 
-    return True
+
+async def _run_slither_async(chain_slug: str, address: str, source_hash: str | None,
+                             sem: asyncio.Semaphore) -> bool:
+    if report_is_cached(chain_slug, address, source_hash):
+        log.info("[♻️] Reusing cached Slither report for %s:%s", chain_slug, address)
+        return True
+
+    async with sem:
+        log.info("[🔎] Running Slither on %s:%s", chain_slug, address)
+        clear_report(address)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *_slither_cmd(chain_slug, address),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            _, stderr = await proc.communicate()
+        except Exception as e:
+            log.error("[❌] Slither subprocess error for %s: %s", address, e)
+            return False
+
+    return _finish_run(chain_slug, address, source_hash, proc.returncode, stderr)
+
+
+async def _skip_unverified(address: str) -> bool:
+    log.info("[⏭️] Skipping Slither for unverified contract %s", address)
+    return False
 
 
-def parse_slither_report(address: str) -> list[tuple[str,str]]:
+def run_slither_batch(jobs: list[tuple], max_workers: int | None = None,
+                      chain_id: int | None = None) -> list[bool]:
+    """
+    Runs Slither on many contracts concurrently, one `slither` subprocess per job and at
+    most `max_workers` (default: CPU count) at a time, so solc compiles overlap without
+    running every one at once.
+
+    `jobs` are (chain_slug, address) or (chain_slug, address, source_hash) tuples. Returns
+    one run_slither()-style result per job, in order. Reports go to the usual per-address
+    slither-reports/<address>.json, so concurrent runs never share an output file.
+    Must not be called from inside a running event loop.
+
+    With `chain_id` (the Etherscan chain id matching the jobs' chain_slug), jobs without a
+    source_hash are first checked in one batched Etherscan pass: unverified contracts have
+    nothing for solc to compile, so they return False without spawning Slither.
+    """
+    jobs = [(job[0], job[1], job[2] if len(job) > 2 else None) for job in jobs]
+
+    if chain_id is not None:
+        unknown = [address for _, address, source_hash in jobs if source_hash is None]
+        hashes = get_source_hashes(unknown, chain_id) if unknown else {}
+        jobs = [
+            (chain_slug, address, source_hash or hashes.get(address))
+            for chain_slug, address, source_hash in jobs
+        ]
+
+    async def _run_all():
+        sem = asyncio.Semaphore(max_workers or os.cpu_count() or 1)
+        return await asyncio.gather(*[
+            _run_slither_async(chain_slug, address, source_hash, sem)
+            if chain_id is None or source_hash is not None
+            else _skip_unverified(address)
+            for chain_slug, address, source_hash in jobs
+        ])
+
+    return list(asyncio.run(_run_all()))
+
+
+def _iter_detectors(path: str):
+    # Yields results.detectors[*] from a Slither report, streaming it when ijson is installed
+    with open(path, "rb") as f:
+        if ijson is not None:
+            yield from ijson.items(f, "results.detectors.item")
+            return
+        raw = f.read()
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    yield from data.get("results", {}).get("detectors", [])
+
+
+@lru_cache(maxsize=1024)
+def _parse_cached(address: str, mtime: float,
+                  check_filter: frozenset[str] | None = None) -> tuple[tuple[str,str], ...]:
+    # Keyed by the report's mtime so a re-run of Slither invalidates the entry
+    findings: list[tuple[str,str]] = []
+    # closing() shuts the report file right away even if parsing raises mid-stream,
+    # instead of leaving the suspended generator's handle open until GC
+    with closing(_iter_detectors(report_path(address))) as detectors:
+        for det in detectors:
+            check_name = det.get("check", "").lower()
+            # Skip unwanted checks before touching impact/confidence or elements
+            if check_filter and check_name not in check_filter:
+                continue
+            impact     = det.get("impact", "").lower()
+            confidence = det.get("confidence", "").lower()
+
+            if impact == "high" and confidence in ("high", "medium"):
+                # First function element names the offending function; stop scanning there
+                function = next(
+                    (el.get("name") for el in det.get("elements", ()) if el.get("type") == "function"),
+                    None,
+                )
+                findings.append((check_name, function))
+    return tuple(findings)
+
+
+def parse_slither_report(address: str, check_filter: set[str] | None = None) -> list[tuple[str,str]]:
     """
     Original parser: collects all (check_name, function_name) where
     impact == high and confidence == high|medium.
+    If `check_filter` is given, only detectors whose (lowercased) check name is in it are kept.
+    Each report is only decoded once per version on disk (see _parse_cached).
     """
-    path = f"slither-reports/{address}.json"
-    if not os.path.isfile(path):
+    # One stat both checks the report exists and gives _parse_cached its invalidation key
+    try:
+        st = os.stat(report_path(address))
+    except FileNotFoundError:
         return []
 
-    data = json.load(open(path, "r"))
-    findings: list[tuple[str,str]] = []
-    for det in data.get("results", {}).get("detectors", []):
-        check_name = det.get("check", "").lower()
-        impact     = det.get("impact", "").lower()
-        confidence = det.get("confidence", "").lower()
+    check_filter = frozenset(check_filter) if check_filter else None
+    return list(_parse_cached(address, st.st_mtime, check_filter))
+
 
-        if impact == "high" and confidence in ("high", "medium"):
-            function = None
-            for el in det.get("elements", []):
-                if el.get("type") == "function":
-                    function = el.get("name")
-                    break
-            findings.append((check_name, function))
-    return findings
+_ARBITRARY_SEND = frozenset({"arbitrary-send-eth"})
 
 
 def find_true_arbitrary_send_vulns(address: str) -> list[str]:
     """
     1) Loads Slither JSON from 'slither-reports/<address>.json'
     2) Keeps only (check_name, fn) where check_name == "arbitrary-send-eth"
-    3) Applies three filters:
-         a) is_nonpublic()      → skip if fn is private/internal
-         b) has_modifier_guard()→ skip if fn has onlyOwner/onlyAdmin
-         c) has_manual_owner_check() → skip if fn has require(msg.sender == owner)
+    3) Classifies every flagged function in one classify_functions() pass and skips any with a flag:
+         a) NONPUBLIC  → fn is private/internal
+         b) GUARDED    → fn has onlyOwner/onlyAdmin
+         c) OWNERCHECK → fn has require(msg.sender == owner)
     Returns a list of function names that survived all filters (i.e. truly
     public arbitrary-send-eth drains).
     """
 
-    path = f"slither-reports/{address}.json"
-    if not os.path.isfile(path):
-        return []
+    # Step 1: grab the high-impact, medium/high-confidence arbitrary-send-eth findings
+    # (memoized per report mtime; a missing report has none)
+    raw_findings = parse_slither_report(address, _ARBITRARY_SEND)
 
-    # Step 1: grab all high-impact, medium/high-confidence findings
-    raw_findings = parse_slither_report(address)
+    # If Slither didn’t give us a function name, skip
+    candidates = [fn for _, fn in raw_findings if fn]
+    if not candidates:
+        return []
 
     # Build the source directory path where the flattened .sol files live:
     source_dir = f"crytic-export/etherscan-contracts/{address}"
+    # One walk + read of the sources classifies every candidate at once
+    flags = classify_functions(source_dir, set(candidates))
 
-    true_vulns: list[str] = []
-    for check_name, fn in raw_findings:
-        # Only care about arbitrary-send-eth
-        if check_name != "arbitrary-send-eth":
-            continue
+    # Flags == 0: fn is truly public and unguarded.  Bingo.
+    return [fn for fn in candidates if flags[fn] == 0]
 
-        # If Slither didn’t give us a function name, skip
-        if not fn:
-            continue
 
-        # 2a) skip private/internal
-        if is_nonpublic(source_dir, fn):
-            continue
+@dataclass
+class ScanBatch:
+    """
+    State of a batch scan kept as parallel columns (index i in every list is addrs[i])
+    rather than one record per contract, so each stage of scan_batch() walks just the
+    column it needs and selects survivors with itertools.compress over a bool column.
+    """
+    chain_slug: str
+    addrs: list[str]
+    source_hashes: list[str | None] = field(default_factory=list)
+    verified: list[bool] = field(default_factory=list)
+    slither_ran: list[bool] = field(default_factory=list)
+    findings: list[list[str]] = field(default_factory=list)  # true arbitrary-send-eth drains
 
-        # 2b) skip if has an onlyOwner or onlyAdmin modifier
-        if has_modifier_guard(source_dir, fn):
-            continue
+    def drainable(self) -> dict[str, list[str]]:
+        """{address: drainable functions} for every contract with at least one finding."""
+        return {addr: fns for addr, fns in zip(self.addrs, self.findings) if fns}
 
-        # 2c) skip if there’s an in‐body `require(msg.sender == owner)`
-        if has_manual_owner_check(source_dir, fn):
-            continue
 
-        # At this point, fn is truly public and unguarded.  Bingo.
-        true_vulns.append(fn)
+def scan_batch(chain_slug: str, addrs: list[str], chain_id: int = 1,
+               max_workers: int | None = None) -> ScanBatch:
+    """
+    Full pipeline for a batch of addresses: one batched Etherscan verification pass,
+    Slither on the verified contracts only (run_slither_batch), then
+    find_true_arbitrary_send_vulns() on every contract Slither finished.
+    Must not be called from inside a running event loop.
+    """
+    batch = ScanBatch(chain_slug, list(addrs))
+    n = len(batch.addrs)
+
+    hashes = get_source_hashes(batch.addrs, chain_id) if batch.addrs else {}
+    batch.source_hashes = [hashes.get(addr) for addr in batch.addrs]
+    batch.verified = [source_hash is not None for source_hash in batch.source_hashes]
 
-    return true_vulns
+    verified_idx = list(compress(range(n), batch.verified))
+    ran = run_slither_batch(
+        [(chain_slug, batch.addrs[i], batch.source_hashes[i]) for i in verified_idx],
+        max_workers,
+    )
+    batch.slither_ran = [False] * n
+    for i, ok in zip(verified_idx, ran):
+        batch.slither_ran[i] = ok
+
+    batch.findings = [
+        find_true_arbitrary_send_vulns(addr) if ok else []
+        for addr, ok in zip(batch.addrs, batch.slither_ran)
+    ]
+    return batch
@@ -0,0 +1,68 @@
+# utils/slither_worker.py
+#
+# Runs Slither in-process instead of shelling out to the `slither` CLI. Meant to be called
+# from long-lived ProcessPoolExecutor workers (see main.py) so each worker pays the
+# slither/crytic-compile import cost once, not once per contract.
+
+from utils.slither_analyzer import (
+    DETECTORS,
+    EXCLUDE_PATHS,
+    log,
+    SOLC_ARGS,
+    clear_report,
+    report_path,
+    run_slither,
+    report_is_cached,
+    remember_report,
+)
+
+try:
+    from slither import Slither
+    from slither.detectors import all_detectors
+    from slither.detectors.abstract_detector import AbstractDetector
+    from slither.utils.output import output_to_json
+except ImportError:
+    # Slither only installed as a CLI (e.g. via pipx): analyze() falls back to run_slither()
+    Slither = None
+
+if Slither is not None:
+    _WANTED = set(DETECTORS.split(","))
+    _DETECTOR_CLASSES = [
+        d for d in vars(all_detectors).values()
+        if isinstance(d, type) and issubclass(d, AbstractDetector) and d.ARGUMENT in _WANTED
+    ]
+
+
+def analyze(chain_slug: str, address: str, source_hash: str | None = None,
+            force: bool = False) -> bool:
+    """
+    In-process equivalent of run_slither(): runs the high-value detectors on chain_slug:address
+    and writes the same slither-reports/<address>.json, so find_true_arbitrary_send_vulns()
+    works unchanged. Returns False if Slither couldn't analyze the contract.
+    """
+    if Slither is None:
+        return run_slither(chain_slug, address, source_hash, force)
+
+    if not force and report_is_cached(chain_slug, address, source_hash):
+        log.info("[♻️] Reusing cached Slither report for %s:%s", chain_slug, address)
+        return True
+
+    log.info("[🔎] Running Slither on %s:%s", chain_slug, address)
+    # Same as the CLI path: a failed re-run must not leave the stale report looking fresh
+    clear_report(address)
+
+    try:
+        # filter_paths is the API name behind the CLI's --exclude-paths
+        slither = Slither(f"{chain_slug}:{address}", solc_args=SOLC_ARGS, filter_paths=[EXCLUDE_PATHS])
+        for detector in _DETECTOR_CLASSES:
+            slither.register_detector(detector)
+        results = [finding for findings in slither.run_detectors() for finding in findings]
+
+        # Inside the try too: a disk or sqlite error fails this contract, not the worker
+        output_to_json(report_path(address), None, {"detectors": results})
+        remember_report(chain_slug, address, source_hash)
+    except Exception as e:
+        log.error("[❌] Slither error for %s: %s", address, e)
+        return False
+
+    return True
@@ -1,28 +1,127 @@
 import requests
+import logging
 import os
 import time
+import hashlib
+from functools import lru_cache
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger("contractsniffer.etherscan")
 
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY", "")
 ETHERSCAN_URL = "https://api.etherscan.io/v2/api"
 
-def is_code_verified(addr, chain_id=1):
-    try:
-        res = requests.get(ETHERSCAN_URL, params={
+# One pooled keep-alive session for every lookup: skips a TCP+TLS handshake per call
+# and backs off automatically on Etherscan's 429 rate limiting and 5xx hiccups
+_SESSION = requests.Session()
+_SESSION.headers.update({"Connection": "keep-alive"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=32,
+    max_retries=Retry(total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# Max comma-separated addresses per getsourcecode call
+ETHERSCAN_BATCH_SIZE = 5
+
+# Free API tier limit, enforced across every thread that calls into this module
+ETHERSCAN_CALLS_PER_SEC = 5
+
+# Etherscan signals rate limiting with HTTP 200 and a string `result` ("Max rate limit
+# reached"), which the adapter's 429 retry never sees; these retries cover that case
+_RATE_LIMIT_RETRIES = 4
+_RATE_LIMIT_BACKOFF = 0.5
+
+_RATE_LOCK = Lock()
+_next_call_at = 0.0
+
+def _throttle():
+    # Reserves the next call slot under the lock, then sleeps until it outside of it,
+    # so calls from all verify workers are spaced 1/ETHERSCAN_CALLS_PER_SEC apart
+    global _next_call_at
+    with _RATE_LOCK:
+        now = time.monotonic()
+        wait = _next_call_at - now
+        _next_call_at = max(now, _next_call_at) + 1 / ETHERSCAN_CALLS_PER_SEC
+    if wait > 0:
+        time.sleep(wait)
+
+def _fetch_sources(addrs, chain_id):
+    for attempt in range(_RATE_LIMIT_RETRIES + 1):
+        _throttle()
+        res = _SESSION.get(ETHERSCAN_URL, timeout=10, params={
             "chainid": chain_id,
             "module": "contract",
             "action": "getsourcecode",
-            "address": addr,
+            "address": ",".join(addrs),
             "apikey": ETHERSCAN_API_KEY
         })
+        result = res.json().get("result", [{}])
+        if not (isinstance(result, str) and "rate limit" in result.lower()):
+            return result
+        if attempt < _RATE_LIMIT_RETRIES:
+            log.info("[⏳] Etherscan rate limit hit, retrying %s", ",".join(addrs))
+            time.sleep(_RATE_LIMIT_BACKOFF * 2 ** attempt)
+    # Raise rather than return: a rate-limited lookup must not be cached as "unverified"
+    raise RuntimeError(f"Etherscan rate limit: {result}")
 
-        result = res.json().get("result", [{}])[0]
-        source = result.get("SourceCode", "")
-        abi = result.get("ABI", "")
+def _hash_if_verified(result):
+    source = result.get("SourceCode", "")
+    abi = result.get("ABI", "")
 
-        if source.strip() and "not verified" not in abi.lower():
-            return True
-        else:
-            return False
+    if source.strip() and "not verified" not in abi.lower():
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+    else:
+        return None
+
+@lru_cache(maxsize=10000)
+def _lookup_source_hash(addr, chain_id):
+    # Raises on network/parse errors so that failed lookups are never cached
+    return _hash_if_verified(_fetch_sources([addr], chain_id)[0])
+
+def get_source_hash(addr, chain_id=1):
+    """
+    Returns a sha256 of the contract's verified Etherscan source, or None if it isn't
+    verified (or the lookup failed). Answers are memoized per (addr, chain_id).
+    """
+    try:
+        return _lookup_source_hash(addr, chain_id)
     except Exception as e:
-        print(f"[!] Etherscan error on {addr}: {e}")
-        return False
\ No newline at end of file
+        log.warning("[!] Etherscan error on %s: %s", addr, e)
+        return None
+
+def get_source_hashes(addrs, chain_id=1):
+    """
+    Batched get_source_hash(): looks addresses up ETHERSCAN_BATCH_SIZE per request.
+    Returns {addr: source_hash or None}. Never raises: a chunk whose answer doesn't
+    line up with the addresses asked for, or has a malformed entry, is retried one
+    address at a time (where errors become None, as in get_source_hash).
+    """
+    hashes = {}
+    for i in range(0, len(addrs), ETHERSCAN_BATCH_SIZE):
+        chunk = addrs[i:i + ETHERSCAN_BATCH_SIZE]
+        decoded = None
+        if len(chunk) > 1:
+            try:
+                results = _fetch_sources(chunk, chain_id)
+                if isinstance(results, list) and len(results) == len(chunk):
+                    decoded = {
+                        addr: _hash_if_verified(result) for addr, result in zip(chunk, results)
+                    }
+            except Exception as e:
+                log.warning("[!] Etherscan error on %s: %s", ",".join(chunk), e)
+
+        if decoded is not None:
+            hashes.update(decoded)
+        else:
+            for addr in chunk:
+                hashes[addr] = get_source_hash(addr, chain_id)
+    return hashes
+
+def is_code_verified(addr, chain_id=1):
+    return get_source_hash(addr, chain_id) is not None
+
+def are_codes_verified(addrs, chain_id=1):
+    """Batched is_code_verified(): returns {addr: bool}."""
+    return {addr: h is not None for addr, h in get_source_hashes(addrs, chain_id).items()}